@@ -21,9 +21,13 @@ Copyright 2017 justin fung. All rights reserved.
 """
 from __future__ import division
 import argparse
+import queue
 import sys
+import threading
 import time
+from operator import attrgetter
 import cv2
+import numpy as np
 import mwt_detection
 import mwt_preprocessing
 import mwt_tracking
@@ -37,110 +41,254 @@ arg_parser.add_argument(
     "--ip", type=str, help="IP address of the camera (e.g., http://192.168.1.64/video)"
 )
 
+# Number of frames buffered between the reader and analysis stages
+# (live inputs only ever buffer the newest frame):
+PREFETCH = 4
+
+# Sentinel passed through the frame queues to signal the end of the stream:
+_END_OF_STREAM = None
+
+# Wave attributes recorded per frame in the wave log, in log header order:
+_wave_log_fields = attrgetter(
+    "name",
+    "mass",
+    "max_mass",
+    "displacement",
+    "max_displacement",
+    "birth",
+    "death",
+    "recognized",
+    "centroid",
+)
+
 def status_update(frame_number, tot_frames):
     """Update status to stdout."""
     if frame_number == 1:
         sys.stdout.write("Starting analysis of %d frames...\n" % tot_frames)
         sys.stdout.flush()
 
+    # Progress dots stay in the stdout buffer; flush once every 100 frames.
     if frame_number % 100 == 0:
         sys.stdout.write("%d" % frame_number)
         sys.stdout.flush()
     elif frame_number % 10 == 0:
         sys.stdout.write(".")
-        sys.stdout.flush()
 
     if frame_number == tot_frames:
         print("End of video reached successfully.")
 
     return
 
-def analyze(video, write_output=True):
-    """Analyze the video."""
+def _read_frames(video, read_q, stop_event, errors, drop_stale):
+    """Decode frames from the video into the read queue.
+
+    Runs on its own thread so that decoding overlaps with analysis.  Always
+    ends the queue with the end-of-stream sentinel, even on error.
+
+    Args:
+        video: video read into program using opencv methods
+        read_q: bounded queue of decoded frames
+        stop_event: event set when the analysis loop has stopped
+        errors: list to which an exception raised while reading is appended
+        drop_stale: if True, discard the oldest queued frame rather than
+                    wait for analysis to take it, so live input never lags
+    """
+    try:
+        while not stop_event.is_set():
+            successful_read, frame = video.read()
+            if not successful_read:
+                break
+            if drop_stale:
+                try:
+                    read_q.get_nowait()
+                except queue.Empty:
+                    pass
+            read_q.put(frame)
+    except Exception as error:
+        errors.append(error)
+        stop_event.set()
+    finally:
+        read_q.put(_END_OF_STREAM)
+
+def _write_frames(out, write_q, stop_event, errors):
+    """Draw, encode and display frames from the write queue.
+
+    Runs on its own thread so that drawing, encoding and display overlap
+    with analysis; the analysis loop never touches the GUI.  When 'q' is
+    pressed or an error is raised (and recorded), sets the stop event and
+    keeps draining the queue without writing until the end-of-stream
+    sentinel, so that the analysis loop is never left blocked.
+
+    Args:
+        out: cv2 videowriter object to which frames are written
+        write_q: bounded queue of (frame, wave snapshots) pairs
+        stop_event: event set to ask the analysis loop to stop
+        errors: list to which an exception raised while writing is appended
+    """
+    try:
+        while True:
+            item = write_q.get()
+            if item is _END_OF_STREAM:
+                return
+
+            frame, snapshots = item
+            frame = mwt_io.draw(
+                snapshots,
+                frame,
+                1 / mwt_preprocessing.RESIZE_FACTOR,
+            )
+            out.write(frame)
+            cv2.imshow("Wave Detection", frame)
+
+            # Stop analysis on 'q' key press
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                stop_event.set()
+                break
+    except Exception as error:
+        errors.append(error)
+        stop_event.set()
+
+    while write_q.get() is not _END_OF_STREAM:
+        pass
+
+def _put_while_alive(write_q, item, writer):
+    """Put an item on the write queue unless the writer thread has exited.
+
+    Args:
+        write_q: bounded queue consumed by the writer thread
+        item: item to put on the queue
+        writer: the writer thread
+    """
+    while writer.is_alive():
+        try:
+            write_q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def analyze(video, write_output=True, log=True, live=False):
+    """Analyze the video.
+
+    Per-frame wave logging is skipped if log is False.  For live input,
+    frames that arrive while the previous one is still being analyzed are
+    dropped so that analysis always works on the newest frame.
+    """
     tracked_waves = []
     recognized_waves = []
     wave_log = []
     frame_num = 1
-    last_frame = None  # Store the previous frame
     num_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) if video.isOpened() else float('inf')
 
+    # Live streams have no meaningful final frame (and drop frames), so only
+    # file input kills all waves on its last frame.
+    last_frame = None if live else num_frames
+
+    # Decode on a reader thread and encode/display on a writer thread;
+    # tracking state stays on this thread only.
+    stop_event = threading.Event()
+    errors = []
+    read_q = queue.Queue(maxsize=1 if live else PREFETCH)
+    reader = threading.Thread(
+        target=_read_frames,
+        args=(video, read_q, stop_event, errors, live),
+        daemon=True,
+    )
+    reader.start()
+
     if write_output:
         out = mwt_io.create_video_writer(video)
+        # A single slot keeps analysis at most a frame ahead of the display,
+        # so that 'q' stops the run promptly.
+        write_q = queue.Queue(maxsize=1)
+        writer = threading.Thread(
+            target=_write_frames,
+            args=(out, write_q, stop_event, errors),
+            daemon=True,
+        )
+        writer.start()
 
     time_start = time.time()
 
-    while True:
-        # Update status with current frame number
-        status_update(frame_num, num_frames)
-
-        successful_read, original_frame = video.read()
-        if not successful_read:
-            break
-
-        # Preprocess the original frame for analysis
-        analysis_frame = mwt_preprocessing.preprocess(original_frame)
-
-        # Detect sections in the analysis frame
-        sections = mwt_detection.detect_sections(analysis_frame, frame_num)
-
-        # Track the waves using the analysis frame, last frame, and current frame number
-        mwt_tracking.track(tracked_waves, analysis_frame, frame_num, last_frame)
-
-        # Log wave data for recognized waves
-        for wave in tracked_waves:
-            wave_log.append(
-                (
-                    frame_num,
-                    wave.name,
-                    wave.mass,
-                    wave.max_mass,
-                    wave.displacement,
-                    wave.max_displacement,
-                    wave.birth,
-                    wave.death,
-                    wave.recognized,
-                    wave.centroid,
+    try:
+        while not stop_event.is_set():
+            # Update status with current frame number
+            status_update(frame_num, num_frames)
+
+            original_frame = read_q.get()
+            if original_frame is _END_OF_STREAM or stop_event.is_set():
+                break
+
+            # Preprocess the original frame for analysis
+            analysis_frame = mwt_preprocessing.preprocess(original_frame)
+
+            # Detect sections in the analysis frame
+            sections = mwt_detection.detect_sections(analysis_frame, frame_num)
+
+            # Track the waves using the analysis frame, current and final frame numbers
+            mwt_tracking.track(tracked_waves, analysis_frame, frame_num, last_frame)
+
+            # Log wave data for recognized waves
+            if log:
+                for wave in tracked_waves:
+                    wave_log.append((frame_num, *_wave_log_fields(wave)))
+
+            # Process waves that have died in a single pass
+            alive_waves = []
+            for wave in tracked_waves:
+                if wave.death is None:
+                    alive_waves.append(wave)
+                elif wave.recognized:
+                    recognized_waves.append(wave)
+            tracked_waves = alive_waves
+
+            # Handle merging of waves.  Waves are only ever appended in birth
+            # order and removed in place, so tracked_waves is already sorted.
+            tops, bottoms = mwt_tracking.get_searchroi_bounds(tracked_waves)
+            merged = False
+            for i, wave in enumerate(tracked_waves):
+                if mwt_tracking.will_be_merged(
+                    wave, np.delete(tops, i), np.delete(bottoms, i)
+                ):
+                    wave.death = frame_num
+                    merged = True
+            if merged:
+                tracked_waves = [wave for wave in tracked_waves if wave.death is None]
+
+            # Add new sections to tracked waves if they are not merging
+            tops, bottoms = mwt_tracking.get_searchroi_bounds(tracked_waves)
+            for section in sections:
+                if not mwt_tracking.will_be_merged(section, tops, bottoms):
+                    tracked_waves.append(section)
+                    tops = np.append(tops, section.searchroi_coors[0][1])
+                    bottoms = np.append(bottoms, section.searchroi_coors[3][1])
+
+            # Optionally write output video
+            if write_output:
+                _put_while_alive(
+                    write_q,
+                    (original_frame, mwt_io.snapshot(tracked_waves)),
+                    writer,
                 )
-            )
 
-        # Update last_frame for next iteration
-        last_frame = analysis_frame.copy()
-
-        # Process waves that have died
-        dead_recognized_waves = [
-            wave for wave in tracked_waves if wave.death is not None and wave.recognized is True
-        ]
-        recognized_waves.extend(dead_recognized_waves)
-        tracked_waves = [wave for wave in tracked_waves if wave.death is None]
-
-        # Sort and handle merging of waves
-        tracked_waves.sort(key=lambda x: x.birth, reverse=True)
-        for wave in tracked_waves:
-            other_waves = [wav for wav in tracked_waves if wav != wave]
-            if mwt_tracking.will_be_merged(wave, other_waves):
-                wave.death = frame_num
-        tracked_waves = [wave for wave in tracked_waves if wave.death is None]
-        tracked_waves.sort(key=lambda x: x.birth, reverse=False)
-
-        # Add new sections to tracked waves if they are not merging
-        for section in sections:
-            if not mwt_tracking.will_be_merged(section, tracked_waves):
-                tracked_waves.append(section)
-
-        # Optionally write output video
+            frame_num += 1
+    finally:
+        # Stop the reader, draining the queue so it is never left blocked.
+        stop_event.set()
+        while reader.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        reader.join()
+
         if write_output:
-            original_frame = mwt_io.draw(
-                tracked_waves,
-                original_frame,
-                1 / mwt_preprocessing.RESIZE_FACTOR,
-            )
-            cv2.imshow("Wave Detection", original_frame)
+            _put_while_alive(write_q, _END_OF_STREAM, writer)
+            writer.join()
+            out.release()
 
-            # Break loop on 'q' key press
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        
-        frame_num += 1
+    # Surface any error raised on the reader or writer thread.
+    if errors:
+        raise errors[0]
 
     # Calculate performance metrics
     time_elapsed = time.time() - time_start
@@ -162,10 +310,6 @@ def analyze(video, write_output=True):
     else:
         print("No waves recognized.")
 
-    # Release output video if writing
-    if write_output:
-        out.release()
-
     return recognized_waves, wave_log, performance
 
 def main():
@@ -174,10 +318,10 @@ def main():
 
     if args.camera:
         print("Using webcam as video input.")
-        inputvideo = cv2.VideoCapture(0)  # Use 0 for default webcam
+        inputvideo = mwt_io.create_video_capture(0)  # Use 0 for default webcam
     elif args.ip:
         print(f"Using IP camera at {args.ip}.")
-        inputvideo = cv2.VideoCapture(args.ip)
+        inputvideo = mwt_io.create_video_capture(args.ip)
     else:
         sys.exit("No input source specified. Use --camera or --ip <ip_address>.")
 
@@ -185,7 +329,9 @@ def main():
     if not inputvideo.isOpened():
         sys.exit("Could not open video. Exiting.")
 
-    recognized_waves, wave_log, program_speed = analyze(inputvideo, write_output=True)
+    recognized_waves, wave_log, program_speed = analyze(
+        inputvideo, write_output=True, live=True
+    )
 
     mwt_io.write_log(wave_log, output_format="json")
     mwt_io.write_report(recognized_waves, program_speed)
@@ -82,9 +82,10 @@ def keep_contour(
     # Obtain contour moments.
     moments = cv2.moments(contour)
 
-    # Filter Contours By Area.
+    # Filter Contours By Area.  The zeroth moment of a contour is its area,
+    # so reuse it rather than walking the contour again.
     if area is True and ret is True:
-        area = cv2.contourArea(contour)
+        area = moments["m00"]
         if area < min_area or area >= max_area:
             ret = False
 
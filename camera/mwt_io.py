@@ -17,6 +17,42 @@ WAVE_LOG_JSONFILE = "wave_log.json"
 RECOGNIZED_WAVE_REPORT_FILE = "recognized_waves.txt"
 TRACKED_WAVE_FILE = "tracked_waves.mp4"
 
+# FFMPEG capture options for RTSP streams (TCP avoids dropped packets):
+RTSP_CAPTURE_OPTIONS = "rtsp_transport;tcp"
+# Timeout in milliseconds when opening a network stream:
+STREAM_OPEN_TIMEOUT_MSEC = 5000
+
+
+def create_video_capture(source):
+    """Create a video capture.
+
+    Opens a webcam or stream with a one-frame capture buffer so that the
+    newest frame is always the one read, rather than a stale buffered one.
+    RTSP streams are opened through the FFMPEG backend over TCP.
+
+    Args:
+        source: webcam index or URL of the video stream
+
+    Returns:
+        input_video: cv2 videocapture object from which frames can be read
+    """
+    if isinstance(source, str) and source.startswith("rtsp://"):
+        os.environ.setdefault(
+            "OPENCV_FFMPEG_CAPTURE_OPTIONS", RTSP_CAPTURE_OPTIONS
+        )
+        input_video = cv2.VideoCapture(
+            source,
+            cv2.CAP_FFMPEG,
+            [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, STREAM_OPEN_TIMEOUT_MSEC],
+        )
+    else:
+        input_video = cv2.VideoCapture(source)
+
+    # Keep only the newest frame in the capture buffer.
+    input_video.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    return input_video
+
 
 def create_video_writer(input_video):
     """Create a video.
@@ -166,87 +202,100 @@ def write_report(waves, performance):
     return
 
 
-def draw(waves, frame, resize_factor):
-    """Draw detection on a frame.
+def snapshot(waves):
+    """Capture the wave statistics drawn on a frame.
 
-    Simple function to draw on a frame for output.  Draws bounding boxes in
-    accordance with wave.boundingbox_coors attribute, and draws some wave stats
-    to accompany each potential wave, including whether or not the object is
-    actually a wave (i.e. wave.recognized == True).
+    Copies out only what draw needs from each live wave, so that a frame can
+    be drawn on another thread while the waves themselves keep updating.
 
     Args:
         waves: list of waves
-        frame: frame on which to draw waves
-        resize_factor: factor to resize boundingbox coors to match output
-                       frame.
 
     Returns:
-        frame: input frame with waves drawn on top
+        snapshots: list of (recognized, mass, displacement, moving_x, moving_y)
+                   tuples, one for each wave with enough history to draw
     """
-    # Iterate through a list of waves.
+    snapshots = []
 
     for wave in waves:
+        if wave.death is None and len(wave.centroid_vec) > 20:
+            # Use moving averages of wave centroid for stat locations
+            moving_x = np.mean(
+                [
+                    wave.centroid_vec[-k][0]
+                    for k in range(1, min(20, 1 + len(wave.centroid_vec)))
+                ]
+            )
+            moving_y = np.mean(
+                [
+                    wave.centroid_vec[-k][1]
+                    for k in range(1, min(20, 1 + len(wave.centroid_vec)))
+                ]
+            )
 
-        # For drawing circles on detected features
-        # center = (wave.centroid[0],wave.centroid[1])
-        # radius = 15
-        # cv2.circle(frame,center,radius,(0,255,0),2)
-
-        if wave.death is None:
-            # If wave is a wave, draw green, else yellow.
-            # Set wave text accordingly.
-            if wave.recognized is True:
-                drawing_color = (0, 255, 0)
-                text = (
-                    f"Wave Detected!\n"
-                    f"mass: { wave.mass}\n"
-                    f"displacement: {wave.displacement}"
+            snapshots.append(
+                (
+                    wave.recognized,
+                    wave.mass,
+                    wave.displacement,
+                    moving_x,
+                    moving_y,
                 )
+            )
 
-            else:
-                drawing_color = (0, 255, 255)
-                text = (
-                    f"Potential Wave\n"
-                    f"mass: {wave.mass}\n"
-                    f"displacement: {wave.displacement}"
-                )
+    return snapshots
 
-            if len(wave.centroid_vec) > 20:
-                # Draw Bounding Boxes:
-                # Get boundingbox coors from wave objects and resize.
-                """
-                rect = wave.boundingbox_coors
-                rect[:] = [resize_factor*rect[i] for i in range(4)]
-                frame = cv2.drawContours(frame, [rect], 0, drawing_color, 2)"""
-
-                # Use moving averages of wave centroid for stat locations
-                moving_x = np.mean(
-                    [
-                        wave.centroid_vec[-k][0]
-                        for k in range(1, min(20, 1 + len(wave.centroid_vec)))
-                    ]
-                )
-                moving_y = np.mean(
-                    [
-                        wave.centroid_vec[-k][1]
-                        for k in range(1, min(20, 1 + len(wave.centroid_vec)))
-                    ]
-                )
 
-                # Draw wave stats on each wave.
-                for i, j in enumerate(text.split("\n")):
-                    frame = cv2.putText(
-                        frame,
-                        text=j,
-                        org=(
-                            int(resize_factor * moving_x),
-                            int(resize_factor * moving_y) + (50 + i * 45),
-                        ),
-                        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale=1.5,
-                        color=drawing_color,
-                        thickness=3,
-                        lineType=cv2.LINE_AA,
-                    )
+def draw(snapshots, frame, resize_factor):
+    """Draw detection on a frame.
+
+    Simple function to draw on a frame for output.  Draws some wave stats
+    to accompany each potential wave, including whether or not the object is
+    actually a wave (i.e. wave.recognized == True).
+
+    Args:
+        snapshots: list of wave snapshots, as returned by snapshot
+        frame: frame on which to draw waves
+        resize_factor: factor to resize wave coors to match output frame.
+
+    Returns:
+        frame: input frame with waves drawn on top
+    """
+    # Iterate through a list of wave snapshots.
+    for recognized, mass, displacement, moving_x, moving_y in snapshots:
+
+        # If wave is a wave, draw green, else yellow.
+        # Set wave text accordingly.
+        if recognized is True:
+            drawing_color = (0, 255, 0)
+            text = (
+                f"Wave Detected!\n"
+                f"mass: {mass}\n"
+                f"displacement: {displacement}"
+            )
+
+        else:
+            drawing_color = (0, 255, 255)
+            text = (
+                f"Potential Wave\n"
+                f"mass: {mass}\n"
+                f"displacement: {displacement}"
+            )
+
+        # Draw wave stats on each wave.
+        for i, j in enumerate(text.split("\n")):
+            frame = cv2.putText(
+                frame,
+                text=j,
+                org=(
+                    int(resize_factor * moving_x),
+                    int(resize_factor * moving_y) + (50 + i * 45),
+                ),
+                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                fontScale=1.5,
+                color=drawing_color,
+                thickness=3,
+                lineType=cv2.LINE_AA,
+            )
 
     return frame
@@ -21,8 +21,11 @@ ANALYSIS_FRAME_HEIGHT = 180
 DISPLACEMENT_THRESHOLD = 10
 MASS_THRESHOLD = 200
 
-# The axis of major waves in the scene, counter-clockwise from horizon:
+# The axis of major waves in the scene, counter-clockwise from horizon.
+# Every section uses this one axis; there is no per-section angle:
 GLOBAL_WAVE_AXIS = 5.0
+# Slope of the global wave axis, precomputed once for per-frame geometry:
+TAN_WAVE_AXIS = math.tan(math.radians(GLOBAL_WAVE_AXIS))
 
 # Global variable seed for naming detected waves:
 NAME_SEED = 0
@@ -44,23 +47,28 @@ class Section:
         self.name = _generate_name()
         self.points = points
         self.birth = birth
-        self.axis_angle = GLOBAL_WAVE_AXIS
         self.centroid = _get_centroid(self.points)
         self.centroid_vec = deque([self.centroid], maxlen=TRACKING_HISTORY)
-        self.original_axis = _get_standard_form_line(self.centroid, self.axis_angle)
-        self.searchroi_coors = _get_searchroi_coors(self.centroid, self.axis_angle, SEARCH_REGION_BUFFER, ANALYSIS_FRAME_WIDTH)
-        self.boundingbox_coors = np.int0(cv2.boxPoints(cv2.minAreaRect(points)))
+        self.original_axis = _get_standard_form_line(self.centroid)
+        # The axis never moves after birth, so normalize it once.
+        a, b, _ = self.original_axis
+        self._inv_norm = 1.0 / math.sqrt(a * a + b * b)
+        self.searchroi_coors = _get_searchroi_coors(self.centroid, SEARCH_REGION_BUFFER, ANALYSIS_FRAME_WIDTH)
+        self.boundingbox_coors = cv2.boxPoints(cv2.minAreaRect(points)).astype(np.int32)
         self.displacement = 0
         self.max_displacement = self.displacement
         self.displacement_vec = deque([self.displacement], maxlen=TRACKING_HISTORY)
         self.mass = len(self.points)
         self.max_mass = self.mass
+        self._last_mass = self.mass
         self.recognized = False
         self.death = None
+        # Scratch buffer reused by update_points to avoid per-frame allocation.
+        self._mask = np.empty((ANALYSIS_FRAME_HEIGHT, ANALYSIS_FRAME_WIDTH), np.uint8)
 
     def update_searchroi_coors(self):
         """Update the search region of interest for tracking the wave."""
-        self.searchroi_coors = _get_searchroi_coors(self.centroid, self.axis_angle, SEARCH_REGION_BUFFER, ANALYSIS_FRAME_WIDTH)
+        self.searchroi_coors = _get_searchroi_coors(self.centroid, SEARCH_REGION_BUFFER, ANALYSIS_FRAME_WIDTH)
 
     def update_death(self, frame_number):
         """Update the death status of the wave.
@@ -71,38 +79,52 @@ class Section:
         if self.points is None:
             self.death = frame_number
 
-    def update_points(self, frame):
+    def update_points(self, frame, foreground):
         """Update wave points based on the current frame.
 
         Args:
             frame: Current frame to obtain a new binary representation of the wave.
+            foreground: Non-zero points of the frame in row-major order, as
+                returned by cv2.findNonZero, or None if there are none.
         """
-        # Create a polygon object of the wave's search region
+        # Restrict the search to the horizontal strip spanned by the ROI
         rect = self.searchroi_coors
-        poly = np.array([rect], dtype=np.int32)
+        ys = [p[1] for p in rect]
+        top = max(0, min(ys))
+        bottom = min(frame.shape[0], max(ys) + 1)
 
-        # Create a zero-valued image to overlay the ROI polygon
-        img = np.zeros((ANALYSIS_FRAME_HEIGHT, ANALYSIS_FRAME_WIDTH), np.uint8)
+        # Foreground points are sorted by row, so the strip is a contiguous slice
+        points = None
+        if foreground is not None and top < bottom:
+            start, stop = np.searchsorted(foreground[:, 0, 1], [top, bottom])
+            points = foreground[start:stop]
 
-        # Fill the polygon ROI in the zero-value image with ones
-        img = cv2.fillPoly(img, poly, 255)
+        if points is not None and len(points) > 0:
+            # Create a polygon object of the wave's search region, relative to the strip
+            poly = np.array([rect], dtype=np.int32)
+            poly[..., 1] -= top
 
-        # Resize mask to match frame size
-        img = cv2.resize(img, (frame.shape[1], frame.shape[0]))
+            # Grow the scratch buffer if the frame exceeds the analysis size
+            if self._mask.shape[0] < frame.shape[0] or self._mask.shape[1] != frame.shape[1]:
+                self._mask = np.empty(frame.shape[:2], np.uint8)
 
-        # Perform bitwise AND with the actual image to obtain a "masked" image
-        res = cv2.bitwise_and(frame, frame, mask=img)
+            # Fill the polygon ROI in the zeroed strip-sized view of the mask
+            img = self._mask[:bottom - top]
+            img.fill(0)
+            cv2.fillPoly(img, poly, 255)
+
+            # Keep the points that fall inside the ROI polygon
+            points = points[img[points[:, 0, 1] - top, points[:, 0, 0]] != 0]
 
-        # Find all points in the ROI
-        points = cv2.findNonZero(res)
         if points is None or len(points) == 0:
             print("No points found in ROI.")
             self.points = None
+            self._last_mass = 0
             return
 
-        # Update points
+        # Update points, caching their count for update_mass
         self.points = points
-
+        self._last_mass = len(points)
 
     def update_centroid(self):
         """Update the centroid of the wave."""
@@ -115,31 +137,29 @@ class Section:
         """Update bounding box coordinates for visualization."""
         if self.points is not None:
             # Calculate moments to determine bounding box
-            X = [p[0][0] for p in self.points]
-            Y = [p[0][1] for p in self.points]
-            mean_x = np.mean(X)
-            mean_y = np.mean(Y)
-            std_x = np.std(X)
-            std_y = np.std(Y)
+            xy = self.points.reshape(-1, 2).astype(np.float32, copy=False)
+            mean = xy.mean(axis=0)
+            std = xy.std(axis=0)
 
             # Capture points without outliers for display
-            points_without_outliers = np.array(
-                [p[0] for p in self.points
-                 if np.abs(p[0][0] - mean_x) < 3 * std_x and
-                    np.abs(p[0][1] - mean_y) < 3 * std_y]
-            )
+            keep = ((xy - mean) ** 2 < (3 * std) ** 2).all(axis=1)
+            points_without_outliers = xy[keep]
+            if len(points_without_outliers) < 3:
+                return
 
             # Calculate the minimum area rectangle for the bounding box
             rect = cv2.minAreaRect(points_without_outliers)
             box = cv2.boxPoints(rect)
-            self.boundingbox_coors = np.int0(box)
+            self.boundingbox_coors = box.astype(np.int32)
         else:
             self.boundingbox_coors = None
 
     def update_displacement(self):
         """Update wave displacement and maximum displacement."""
         if self.centroid is not None:
-            self.displacement = _get_orthogonal_displacement(self.centroid, self.original_axis)
+            a, b, c = self.original_axis
+            x, y = self.centroid
+            self.displacement = int(abs(a * x + b * y + c) * self._inv_norm)
 
             # Update maximum displacement if necessary
             if self.displacement > self.max_displacement:
@@ -150,7 +170,7 @@ class Section:
 
     def update_mass(self):
         """Update the mass of the wave."""
-        self.mass = _get_mass(self.points)
+        self.mass = self._last_mass
 
         # Update maximum mass if necessary
         if self.mass > self.max_mass:
@@ -163,48 +183,20 @@ class Section:
                 self.recognized = True
 
 
-def _get_mass(points):
-    """Calculate the mass of the wave.
-
-    Args:
-        points: Array of non-zero points.
-
-    Returns:
-        mass: Total number of points representing the mass.
-    """
-    return len(points) if points is not None else 0
-
-
-def _get_orthogonal_displacement(point, standard_form_line):
-    """Calculate the orthogonal distance of a point to a line.
+def _get_standard_form_line(point):
+    """Get the standard form representation of a line along the global wave axis.
 
     Args:
-        point: A two-element array representing a point [x, y].
-        standard_form_line: A three-element array representing a line in standard form [A, B, C].
+        point: A two-element array representing a point [x, y] on the line.
 
     Returns:
-        ortho_disp: Orthogonal distance from the point to the line.
+        coefficients: A three-element tuple of floats representing line coefficients (A, B, C).
     """
-    a, b, c = standard_form_line
-    x0, y0 = point
-    return int(np.abs(a * x0 + b * y0 + c) / math.sqrt(a**2 + b**2))
-
-
-def _get_standard_form_line(point, angle):
-    """Get the standard form representation of a line based on a point and angle.
-
-    Args:
-        point: A two-element array representing a point [x, y].
-        angle: Float representing the counterclockwise angle from the horizon of the line.
-
-    Returns:
-        coefficients: A three-element array representing line coefficients [A, B, C].
-    """
-    coefficients = [
-        np.tan(np.deg2rad(-angle)),
-        -1,
-        point[1] - np.tan(np.deg2rad(-angle)) * point[0]
-    ]
+    coefficients = (
+        -TAN_WAVE_AXIS,
+        -1.0,
+        float(point[1] + TAN_WAVE_AXIS * point[0])
+    )
     return coefficients
 
 
@@ -217,27 +209,27 @@ def _get_centroid(points):
     Returns:
         centroid: A two-element array [x, y] representing the center of mass, or None if points are empty.
     """
-    if points is not None:
-        x_coords = [p[0][0] for p in points]
-        y_coords = [p[0][1] for p in points]
-        return [int(sum(x_coords) / len(points)), int(sum(y_coords) / len(points))]
-    return None
+    if points is None or len(points) == 0:
+        return None
+    mean = points.reshape(-1, 2).mean(axis=0)
+    return [int(mean[0]), int(mean[1])]
 
 
-def _get_searchroi_coors(centroid, angle, searchroi_buffer, frame_width):
+def _get_searchroi_coors(centroid, searchroi_buffer, frame_width):
     """Get the coordinates of the search region of interest.
 
+    The region is a band along the global wave axis.
+
     Args:
         centroid: A two-element array representing the center of mass of the wave.
-        angle: Counterclockwise angle from the horizon of the wave's axis.
         searchroi_buffer: Buffer in pixels to expand the search region.
         frame_width: Width of the frame to establish bounds.
 
     Returns:
         polygon_coors: A four-element array representing coordinates of the search region polygon.
     """
-    delta_y_left = np.round(centroid[0] * np.tan(np.deg2rad(angle)))
-    delta_y_right = np.round((frame_width - centroid[0]) * np.tan(np.deg2rad(angle)))
+    delta_y_left = round(centroid[0] * TAN_WAVE_AXIS)
+    delta_y_right = round((frame_width - centroid[0]) * TAN_WAVE_AXIS)
 
     upper_left = [0, int(centroid[1] + delta_y_left - searchroi_buffer)]
     upper_right = [frame_width, int(centroid[1] - delta_y_right - searchroi_buffer)]
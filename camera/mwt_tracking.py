@@ -8,39 +8,57 @@ Method for recognition is:
 
 from __future__ import division
 
+import cv2
 import numpy as np
 
+from mwt_objects import TAN_WAVE_AXIS
 
-def will_be_merged(section, list_of_waves):
+
+def get_searchroi_bounds(list_of_waves):
+    """Return the vertical bounds of each wave's search region.
+
+    Args:
+        list_of_waves: a list of waves having search regions
+
+    Returns:
+        tops: array of the y coordinate of each search region's top left
+              corner
+        bottoms: array of the y coordinate of each search region's bottom
+                 left corner
+    """
+    tops = np.fromiter(
+        (wave.searchroi_coors[0][1] for wave in list_of_waves),
+        dtype=np.int32,
+        count=len(list_of_waves),
+    )
+    bottoms = np.fromiter(
+        (wave.searchroi_coors[3][1] for wave in list_of_waves),
+        dtype=np.int32,
+        count=len(list_of_waves),
+    )
+
+    return tops, bottoms
+
+
+def will_be_merged(section, tops, bottoms):
     """Return whether or not a section is in an existing wave's search region.
 
     Args:
         section: a wave object
-        list_of_waves: a list of waves having search regions in which a
-                       wave might fall
+        tops: array of search region top bounds of existing waves, as
+              returned by get_searchroi_bounds
+        bottoms: array of search region bottom bounds of existing waves
 
     Returns:
         going_to_be_merged: evaluates to True if the section is in an
                             existing wave's search region.
     """
-    # All sections are initially new waves & will not be merged.
-    going_to_be_merged = False
-
     # Find the section's major axis' projection on the y axis.
-    delta_y_left = np.round(
-        section.centroid[0] * np.tan(np.deg2rad(section.axis_angle))
-    )
+    delta_y_left = round(section.centroid[0] * TAN_WAVE_AXIS)
     left_y = int(section.centroid[1] + delta_y_left)
 
-    # For each existing wave, see if the section's axis falls in
-    # another wave's search region.
-    for wave in list_of_waves:
-        if (
-            left_y >= wave.searchroi_coors[0][1]
-            and left_y <= wave.searchroi_coors[3][1]
-        ):
-            going_to_be_merged = True
-            break
+    # See if the section's axis falls in any other wave's search region.
+    going_to_be_merged = bool(((tops <= left_y) & (left_y <= bottoms)).any())
 
     return going_to_be_merged
 
@@ -54,40 +72,33 @@ def track(list_of_waves, frame, frame_number, last_frame):
         frame: a frame from a cv2.video_reader object
         frame_number: number of the frame in a sequence
         last_frame: final frame number, provided to kill all waves if
-                    necessary
+                    necessary, or None for live input with no final frame
     """
+    # Ensure frame_number is a scalar, once for all waves.
+    if isinstance(frame_number, np.ndarray):
+        frame_number = int(frame_number.item())
 
-    # Ensure frame_number is a scalar
-    if isinstance(frame_number, (np.ndarray, list)):
-        frame_number = frame_number.item() if isinstance(frame_number, np.ndarray) else frame_number[0]
+    # All waves are killed on the final frame.
+    is_last_frame = frame_number == last_frame
 
-    # Ensure last_frame is a scalar
-    if isinstance(last_frame, np.ndarray):
-        if last_frame.size == 1:
-            last_frame = last_frame.item()
-        else:
-            print("Warning: last_frame is an array with multiple elements. Using only the first element.")
-            last_frame = last_frame[0]  # or handle this case as needed
-    elif isinstance(last_frame, list):
-        last_frame = last_frame[0]  # or handle this case as needed
+    # Find the frame's non-zero points once, rather than once per wave.
+    foreground = cv2.findNonZero(frame) if list_of_waves else None
+    if foreground is not None:
+        foreground = foreground.reshape(-1, 1, 2)
 
     for wave in list_of_waves:
         # Update search roi for tracking waves and merging waves.
         wave.update_searchroi_coors()
 
         # Capture all non-zero points in the new roi.
-        wave.update_points(frame)
+        wave.update_points(frame, foreground)
 
         # Check if wave has died.
         wave.update_death(frame_number)
 
-        # Modify the comparison to handle last_frame as an array
-        if isinstance(last_frame, (np.ndarray, list)):
-            if frame_number in last_frame:  # Check if frame_number is in last_frame array
-                wave.death = frame_number
-        else:
-            if frame_number == last_frame:
-                wave.death = frame_number
+        # Kill all waves on the final frame.
+        if is_last_frame:
+            wave.death = frame_number
 
         # Update centroids.
         wave.update_centroid()